@@ -59,6 +59,7 @@ class DownloaderGUI:
             self.default_download_dir = "./downloads"
             self.default_proxy_mode = "system"
             self.default_proxies = {}
+            self.default_auto_tune = False
             return
         
         try:
@@ -69,6 +70,7 @@ class DownloaderGUI:
             self.default_download_dir = settings.get("download_dir", "./downloads")
             self.default_proxy_mode = settings.get("proxy_mode", "system")
             self.default_proxies = settings.get("proxies", {})
+            self.default_auto_tune = settings.get("auto_tune", False)
         except Exception as e:
             messagebox.showerror("加载设置失败", f"无法加载设置：{str(e)}")
             self.load_default_settings()
@@ -80,6 +82,7 @@ class DownloaderGUI:
             "download_dir": self.default_download_dir,
             "proxy_mode": self.default_proxy_mode,
             "proxies": self.default_proxies,
+            "auto_tune": self.default_auto_tune,
         }
         try:
             with open(self.settings_file, "w") as f:
@@ -90,7 +93,7 @@ class DownloaderGUI:
     def open_settings(self):
         settings_window = tk.Toplevel(self.root)
         settings_window.title("设置")
-        settings_window.geometry("350x500")
+        settings_window.geometry("350x540")
         
         tk.Label(settings_window, text="下载目录:").pack(pady=5)
         download_dir_frame = tk.Frame(settings_window)
@@ -110,6 +113,9 @@ class DownloaderGUI:
         self.chunk_size_entry.insert(0, str(self.default_chunk_size // (1024 * 1024)))
         self.chunk_size_entry.pack(pady=5)
         
+        self.auto_tune_var = tk.BooleanVar(value=self.default_auto_tune)
+        tk.Checkbutton(settings_window, text="按主机自动调优分块大小和线程数", variable=self.auto_tune_var).pack(pady=5)
+        
         tk.Label(settings_window, text="代理模式:").pack(pady=5)
         proxy_mode_frame = tk.Frame(settings_window)
         proxy_mode_frame.pack(fill=tk.X, pady=5)
@@ -135,6 +141,7 @@ class DownloaderGUI:
             self.default_download_dir = self.download_dir_entry.get().strip()
             self.default_process_count = int(self.process_count_entry.get().strip())
             self.default_chunk_size = int(self.chunk_size_entry.get().strip()) * 1024 * 1024
+            self.default_auto_tune = self.auto_tune_var.get()
             self.default_proxy_mode = self.proxy_mode_var.get()
             proxies_str = self.proxies_entry.get().strip()
             self.default_proxies = json.loads(proxies_str) if proxies_str else {}
@@ -170,7 +177,8 @@ class DownloaderGUI:
                 chunk_size_mb=self.default_chunk_size // (1024 * 1024),
                 max_workers=self.default_process_count,
                 proxy_mode=self.default_proxy_mode,
-                proxies=self.default_proxies if self.default_proxy_mode == "manual" else None
+                proxies=self.default_proxies if self.default_proxy_mode == "manual" else None,
+                auto_tune=self.default_auto_tune
             )
             task_widgets = self.create_task_widgets(task_id, filename, url)
             self.tasks[task_id] = {
@@ -408,6 +416,7 @@ class DownloaderGUI:
                         "chunk_size": self.default_chunk_size,
                         "proxy_mode": self.default_proxy_mode,
                         "proxies": self.default_proxies,
+                        "auto_tune": self.default_auto_tune,
                         "stopped": task_info["stopped"],
                     })
         with open(self.archive_file, "w") as f:
@@ -428,6 +437,7 @@ class DownloaderGUI:
                 chunk_size = task_data["chunk_size"]
                 proxy_mode = task_data["proxy_mode"]
                 proxies = task_data["proxies"]
+                auto_tune = task_data.get("auto_tune", False)
                 stopped = task_data.get("stopped", False)
                 downloader = Downloader(
                     url=url,
@@ -435,7 +445,8 @@ class DownloaderGUI:
                     chunk_size_mb=chunk_size // (1024 * 1024),
                     max_workers=process_count,
                     proxy_mode=proxy_mode,
-                    proxies=proxies if proxy_mode == "manual" else None
+                    proxies=proxies if proxy_mode == "manual" else None,
+                    auto_tune=auto_tune
                 )
                 task_widgets = self.create_task_widgets(task_id, filename, url)
                 self.tasks[task_id] = {
@@ -1,2 +1,3 @@
 from .core import Downloader
+from .tuning import HostProfileStore
 from .plugin import load_all
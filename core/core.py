@@ -7,9 +7,12 @@ from urllib.parse import unquote, urlparse
 from tqdm import tqdm
 import urllib3
 
+from .transport import Transport, TransportError, select_transport
+from .tuning import MIN_PROBE_FILE_SIZE, HostProfileStore, Prober, host_of
+
 
 class Downloader:
-    def __init__(self, url, download_dir=".", chunk_size_mb=20, max_workers=None, proxy_mode="system", proxies=None):
+    def __init__(self, url, download_dir=".", chunk_size_mb=20, max_workers=None, proxy_mode="system", proxies=None, auto_tune=False, profile_store=None, transport="auto"):
         self.url = url
         self.download_dir = download_dir
         self.chunk_size_mb = chunk_size_mb
@@ -19,6 +22,11 @@ class Downloader:
         self.stop_flag = False
         self.overall_pbar = None
         self.complete_flag = False
+        self.auto_tune = auto_tune
+        self.profile_store = profile_store or (HostProfileStore() if auto_tune else None)
+        self.transport = transport
+        self.transport_name = None
+        self.range_supported = None
 
     def is_completed(self):
         return self.complete_flag
@@ -82,38 +90,102 @@ class Downloader:
         with open(state_file, 'w') as f:
             json.dump(config, f)
 
+    def tune(self, session, file_size):
+        host = host_of(self.url)
+        profile = self.profile_store.get(host)
+        if profile is None:
+            if file_size < MIN_PROBE_FILE_SIZE:
+                # 文件太小时探测预算不够测出稳定的吞吐量，直接使用默认参数
+                return
+            try:
+                profile = Prober(self.url, file_size, proxies=self.proxies, max_connections=self.max_workers).run(session)
+            except requests.RequestException as e:
+                print(f"Probe failed for {host}, using defaults: {e}")
+                return
+            self.profile_store.put(host, profile)
+        self.chunk_size_mb = profile["chunk_size_mb"]
+        self.max_workers = profile["max_workers"]
+
+    def supports_range(self, session):
+        response = session.get(self.url, headers={"Range": "bytes=0-0"}, stream=True, proxies=self.proxies, timeout=60, verify=False)
+        response.close()
+        self.range_supported = response.status_code == 206
+        return self.range_supported
+
+    def compute_ranges(self, file_size):
+        chunk_size_bytes = self.chunk_size_mb * 1024 * 1024
+
+        if (chunk_size_bytes * self.max_workers) >= file_size:
+            total_chunks = self.max_workers
+            chunk_size_bytes = file_size // total_chunks
+            remainder = file_size % total_chunks
+        else:
+            total_chunks = (file_size + chunk_size_bytes - 1) // chunk_size_bytes
+            remainder = 0
+
+        ranges = []
+        for i in range(total_chunks):
+            start_byte = i * chunk_size_bytes
+            end_byte = min(start_byte + chunk_size_bytes - 1, file_size - 1)
+
+            if i == total_chunks - 1 and remainder > 0:
+                end_byte += remainder
+
+            ranges.append((start_byte, end_byte))
+        return ranges
+
     def calculate_downloaded_size(self, chunk_files):
         return sum(os.path.getsize(chunk_file) for chunk_file in chunk_files if os.path.exists(chunk_file))
 
-    def download_chunk(self, session, chunk_index, chunk_file_path, start_byte, end_byte, retries=3):
+    def select_transport(self, session, redirected=False):
+        if isinstance(self.transport, Transport):
+            return self.transport
+        prefer = self.transport
+        if prefer == "auto" and redirected:
+            prefer = "http1"
+        return select_transport(self.url, session=session, proxies=self.proxies, prefer=prefer)
+
+    def download_chunk(self, transport, chunk_index, chunk_file_path, start_byte, end_byte, retries=3):
         downloaded_size = os.path.getsize(chunk_file_path) if os.path.exists(chunk_file_path) else 0
         remaining_bytes = end_byte - (start_byte + downloaded_size) + 1
         if remaining_bytes <= 0:
             self.overall_pbar.update(remaining_bytes)
             return
-        headers = {"Range": f"bytes={start_byte + downloaded_size}-{end_byte}"}
         while retries > 0:
             if self.stop_flag:
                 print(f"Stopping chunk {chunk_index}...")
                 return
             try:
-                response = session.get(self.url, headers=headers, stream=True, proxies=self.proxies, timeout=60, verify=False)  # 使用 self.url
-                response.raise_for_status()
-                with open(chunk_file_path, "ab") as f:
-                    for chunk in response.iter_content(chunk_size=65536):
-                        if self.stop_flag:
-                            print(f"Stopping chunk {chunk_index} during download...")
-                            return
-                        if chunk:
-                            written_bytes = len(chunk)
-                            f.write(chunk[:remaining_bytes])
-                            self.overall_pbar.update(len(chunk))
-                            remaining_bytes -= len(chunk)
-                            if remaining_bytes <= 0:
-                                break
+                range_start = end_byte - remaining_bytes + 1
+                response = transport.open_range(self.url, range_start, end_byte, timeout=60)  # 使用 self.url
+                try:
+                    mode = "ab"
+                    if response.status_code == 200 and start_byte == 0:
+                        # 服务器忽略了 Range，返回的是整个文件，只能从头重写这一块
+                        self.overall_pbar.update(start_byte - range_start)
+                        remaining_bytes = end_byte - start_byte + 1
+                        mode = "wb"
+                    elif response.status_code != 206:
+                        raise TransportError(f"Expected 206 for chunk {chunk_index}, got {response.status_code}")
+                    with open(chunk_file_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            if self.stop_flag:
+                                print(f"Stopping chunk {chunk_index} during download...")
+                                return
+                            if chunk:
+                                written_bytes = len(chunk)
+                                f.write(chunk[:remaining_bytes])
+                                self.overall_pbar.update(len(chunk))
+                                remaining_bytes -= len(chunk)
+                                if remaining_bytes <= 0:
+                                    break
+                finally:
+                    response.close()
                 return
             except requests.RequestException:
                 retries -= 1
+                if retries == 0:
+                    raise
 
     def merge_chunks(self, chunk_files, final_file_path):
         with open(final_file_path, "wb") as final_file:
@@ -135,24 +207,22 @@ class Downloader:
         temp_folder = os.path.join(self.download_dir, os.path.splitext(file_name)[0])
         os.makedirs(temp_folder, exist_ok=True)
         final_file_path = os.path.join(self.download_dir, file_name)
+        range_supported = file_size == 0 or self.supports_range(session)
         config = self.load_config(temp_folder, file_name)
         if config:
             self.chunk_size_mb = config["chunk_size_bytes"] // (1024 * 1024)
             self.max_workers = config["max_workers"]
         else:
+            if self.auto_tune and file_size > 0 and range_supported:
+                self.tune(session, file_size)
             self.save_config(temp_folder, file_name)
 
-        chunk_size_bytes = self.chunk_size_mb * 1024 * 1024
-
-        if (chunk_size_bytes * self.max_workers) >= file_size:
-            total_chunks = self.max_workers
-            chunk_size_bytes = file_size // total_chunks
-            remainder = file_size % total_chunks
+        if range_supported:
+            ranges = self.compute_ranges(file_size)
         else:
-            total_chunks = (file_size + chunk_size_bytes - 1) // chunk_size_bytes
-            remainder = 0
-
-        chunk_files = [os.path.join(temp_folder, f"{file_name}.part{i}") for i in range(total_chunks)]
+            # 服务器不支持 Range，只能整体下载一个分块
+            ranges = [(0, file_size - 1)]
+        chunk_files = [os.path.join(temp_folder, f"{file_name}.part{i}") for i in range(len(ranges))]
         downloaded_size = self.calculate_downloaded_size(chunk_files)
 
         self.overall_pbar = tqdm(
@@ -164,27 +234,28 @@ class Downloader:
             initial=downloaded_size
         )
 
-        futures = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            for i in range(total_chunks):
-                if self.stop_flag:
-                    print("Stopping download process...")
-                    return
-
-                start_byte = i * chunk_size_bytes
-                end_byte = min(start_byte + chunk_size_bytes - 1, file_size - 1)
+        transport = self.select_transport(session, redirected=bool(response.history))
+        self.transport_name = transport.name
 
-                if i == total_chunks - 1 and remainder > 0:
-                    end_byte += remainder
+        try:
+            futures = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for i, (start_byte, end_byte) in enumerate(ranges):
+                    if self.stop_flag:
+                        print("Stopping download process...")
+                        return
 
-                chunk_file_path = chunk_files[i]
-                futures.append(executor.submit(self.download_chunk, session, i, chunk_file_path, start_byte, end_byte))
+                    chunk_file_path = chunk_files[i]
+                    futures.append(executor.submit(self.download_chunk, transport, i, chunk_file_path, start_byte, end_byte))
 
-            for future in as_completed(futures):
-                if self.stop_flag:
-                    print("Stopping during future completion...")
-                    return
-                future.result()
+                for future in as_completed(futures):
+                    if self.stop_flag:
+                        print("Stopping during future completion...")
+                        return
+                    future.result()
+        finally:
+            if transport is not self.transport:
+                transport.close()
 
         if not self.stop_flag:
             self.merge_chunks(chunk_files, final_file_path)
@@ -0,0 +1,501 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import requests
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from tqdm import tqdm
+
+from .core import Downloader
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _CoordinatorHandler(_JSONHandler):
+    def do_POST(self):
+        if self.path != "/heartbeat":
+            self.send_json({"error": "not found"}, 404)
+            return
+        payload = self.read_json()
+        address = payload.get("address")
+        if not address:
+            # 工作节点监听在 0.0.0.0 等通配地址时，用心跳的来源 IP 加上它上报的端口
+            client_host = self.client_address[0]
+            if ":" in client_host:
+                client_host = f"[{client_host}]"
+            address = f"http://{client_host}:{payload['port']}"
+        self.send_json(self.server.coordinator.heartbeat(payload["worker_id"], address, payload.get("shards", {})))
+
+
+class Coordinator:
+    def __init__(self, url, download_dir=".", host="127.0.0.1", port=9000, num_workers=1, chunk_size_mb=20, shards_per_worker=2,
+                 heartbeat_timeout=10, stall_heartbeats=15, max_attempts=5, assemble=True, proxy_mode="system", proxies=None):
+        self.downloader = Downloader(url, download_dir=download_dir, chunk_size_mb=chunk_size_mb, max_workers=num_workers * shards_per_worker,
+                                     proxy_mode=proxy_mode, proxies=proxies)
+        self.url = url
+        self.download_dir = download_dir
+        self.host = host
+        self.port = port
+        self.shards_per_worker = shards_per_worker
+        self.heartbeat_timeout = heartbeat_timeout
+        self.stall_heartbeats = stall_heartbeats
+        self.max_attempts = max_attempts
+        self.assemble = assemble
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.shards = {}
+        self.fetching = set()
+        self.file_name = None
+        self.file_size = 0
+        self.final_file_path = None
+        self.error = None
+        self.stop_flag = False
+        self.complete_flag = False
+
+    def is_completed(self):
+        return self.complete_flag
+
+    def stop(self, flag):
+        self.stop_flag = flag
+
+    def plan(self):
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        response = requests.head(self.url, allow_redirects=True, proxies=self.downloader.proxies)
+        response.raise_for_status()
+        self.file_name = self.downloader.parse_filename_from_headers(response.headers)
+        self.file_size = int(response.headers.get("Content-Length", 0))
+        if self.file_size <= 0:
+            raise ValueError(f"Distributed download needs a Content-Length for {self.url}")
+        probe = requests.get(self.url, headers={"Range": "bytes=0-0"}, stream=True, proxies=self.downloader.proxies, timeout=60, verify=False)
+        probe.close()
+        if probe.status_code != 206:
+            raise ValueError(f"{self.url} does not support Range requests (status {probe.status_code})")
+        self.final_file_path = os.path.join(self.download_dir, self.file_name)
+        ranges = self.downloader.compute_ranges(self.file_size)
+        # 分片布局也参与 job_id，换了分块参数后不会复用旧分片
+        job_id = hashlib.sha1(json.dumps([self.url, self.file_size, ranges]).encode()).hexdigest()[:12]
+        for i, (start_byte, end_byte) in enumerate(ranges):
+            key = f"{job_id}.{i}"
+            self.shards[key] = {
+                "key": key,
+                "start": start_byte,
+                "end": end_byte,
+                "state": "pending",
+                "worker": None,
+                "sha256": None,
+                "attempts": 0,
+                "progress": 0,
+                "stalls": 0,
+            }
+        if self.assemble:
+            os.makedirs(self.download_dir, exist_ok=True)
+            with open(self.final_file_path, "wb") as f:
+                f.truncate(self.file_size)
+
+    def heartbeat(self, worker_id, address, reports):
+        with self.lock:
+            worker = self.workers.setdefault(worker_id, {"alive": True})
+            if not worker["alive"]:
+                print(f"Worker {worker_id} rejoined")
+            worker.update(address=address, last_seen=time.monotonic(), alive=True)
+
+            release = []
+            for key, report in reports.items():
+                shard = self.shards.get(key)
+                if shard is None or shard["worker"] != worker_id:
+                    release.append(key)
+                    continue
+                if shard["state"] != "assigned" or report["attempt"] != shard["attempts"]:
+                    continue
+                expected_size = shard["end"] - shard["start"] + 1
+                if report["state"] == "done" and report["size"] == expected_size:
+                    shard["state"] = "done"
+                    shard["sha256"] = report["sha256"]
+                elif report["state"] == "done" or report["state"] == "failed":
+                    print(f"Shard {key} failed on worker {worker_id}")
+                    self.requeue(shard)
+                elif report["size"] > shard["progress"]:
+                    shard["progress"] = report["size"]
+                    shard["stalls"] = 0
+                else:
+                    shard["stalls"] += 1
+                    if shard["stalls"] >= self.stall_heartbeats:
+                        print(f"Shard {key} stalled on worker {worker_id}, reassigning")
+                        self.requeue(shard)
+                        release.append(key)
+
+            active = [s for s in self.shards.values() if s["worker"] == worker_id and s["state"] == "assigned"]
+            for shard in self.shards.values():
+                if len(active) >= self.shards_per_worker:
+                    break
+                if shard["state"] == "pending" and shard["key"] not in release and self.error is None:
+                    shard["state"] = "assigned"
+                    shard["worker"] = worker_id
+                    shard["attempts"] += 1
+                    active.append(shard)
+
+            return {
+                "url": self.url,
+                "assign": [{"key": s["key"], "start": s["start"], "end": s["end"], "attempt": s["attempts"]} for s in active],
+                "release": release,
+            }
+
+    def requeue(self, shard):
+        shard["state"] = "pending"
+        shard["worker"] = None
+        shard["sha256"] = None
+        shard["progress"] = 0
+        shard["stalls"] = 0
+        if shard["attempts"] >= self.max_attempts:
+            self.error = f"Shard {shard['key']} failed after {shard['attempts']} attempts"
+
+    def check_workers(self):
+        now = time.monotonic()
+        with self.lock:
+            for worker_id, worker in self.workers.items():
+                if not worker["alive"] or now - worker["last_seen"] <= self.heartbeat_timeout:
+                    continue
+                worker["alive"] = False
+                lost = [s for s in self.shards.values() if s["worker"] == worker_id and s["state"] in ("assigned", "done")]
+                print(f"Worker {worker_id} missed heartbeats, reassigning {len(lost)} shards")
+                for shard in lost:
+                    self.requeue(shard)
+
+    def fetch_shard(self, key, worker_id, address, sha256):
+        shard = self.shards[key]
+        expected_size = shard["end"] - shard["start"] + 1
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with requests.get(f"{address}/shards/{key}", stream=True, timeout=60) as response:
+                response.raise_for_status()
+                with open(self.final_file_path, "r+b") as f:
+                    f.seek(shard["start"])
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        if self.stop_flag:
+                            break
+                        digest.update(chunk)
+                        f.write(chunk[:max(0, expected_size - size)])
+                        size += len(chunk)
+                        if size > expected_size:
+                            # 数据比分片长，再写就会覆盖相邻分片
+                            break
+            verified = size == expected_size and digest.hexdigest() == sha256
+        except Exception as e:
+            # 写文件出错等异常也要走到下面，否则分片会一直留在 fetching 里
+            print(f"Fetching shard {key} from worker {worker_id} failed: {e}")
+            verified = None
+        with self.lock:
+            self.fetching.discard(key)
+            if shard["state"] != "done" or shard["worker"] != worker_id:
+                return
+            if verified:
+                shard["state"] = "assembled"
+            else:
+                if verified is False:
+                    print(f"Integrity check failed for shard {key} from worker {worker_id}")
+                self.requeue(shard)
+
+    def schedule_assembly(self, executor):
+        with self.lock:
+            for key, shard in self.shards.items():
+                if shard["state"] == "done" and key not in self.fetching:
+                    self.fetching.add(key)
+                    address = self.workers[shard["worker"]]["address"]
+                    executor.submit(self.fetch_shard, key, shard["worker"], address, shard["sha256"])
+
+    def is_finished(self):
+        final_state = "assembled" if self.assemble else "done"
+        with self.lock:
+            return all(s["state"] == final_state for s in self.shards.values())
+
+    def release_shards(self):
+        for shard in self.shards.values():
+            address = self.workers[shard["worker"]]["address"]
+            try:
+                requests.delete(f"{address}/shards/{shard['key']}", timeout=10)
+            except requests.RequestException:
+                pass
+
+    def write_manifest(self):
+        manifest = {
+            "url": self.url,
+            "file_name": self.file_name,
+            "file_size": self.file_size,
+            "shards": [
+                {
+                    "key": s["key"],
+                    "start": s["start"],
+                    "end": s["end"],
+                    "sha256": s["sha256"],
+                    "attempt": s["attempts"],
+                    "worker": s["worker"],
+                    "address": self.workers[s["worker"]]["address"],
+                }
+                for s in self.shards.values()
+            ],
+        }
+        os.makedirs(self.download_dir, exist_ok=True)
+        manifest_file = os.path.join(self.download_dir, f"{self.file_name}.manifest.json")
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=4)
+        return manifest_file
+
+    def run(self):
+        self.plan()
+        server = ThreadingHTTPServer((self.host, self.port), _CoordinatorHandler)
+        server.coordinator = self
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        print(f"Coordinator listening on http://{self.host}:{server.server_address[1]} with {len(self.shards)} shards")
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                while not self.stop_flag:
+                    self.check_workers()
+                    if self.error:
+                        raise RuntimeError(self.error)
+                    if self.assemble:
+                        self.schedule_assembly(executor)
+                    if self.is_finished():
+                        break
+                    time.sleep(0.5)
+        finally:
+            server.shutdown()
+            server.server_close()
+        if self.stop_flag:
+            print("Stopping coordinator...")
+            return
+        if self.assemble:
+            self.release_shards()
+            print(f"Assembled {self.final_file_path}")
+        else:
+            print(f"Shards kept on workers, manifest written to {self.write_manifest()}")
+        self.complete_flag = True
+
+
+class _WorkerHandler(_JSONHandler):
+    def do_GET(self):
+        path = self.server.worker.shard_path(self.path[len("/shards/"):]) if self.path.startswith("/shards/") else None
+        if path is None:
+            self.send_json({"error": "not found"}, 404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                self.wfile.write(block)
+
+    def do_DELETE(self):
+        if not self.path.startswith("/shards/"):
+            self.send_json({"error": "not found"}, 404)
+            return
+        self.server.worker.release(self.path[len("/shards/"):])
+        self.send_json({"released": True})
+
+
+class Worker:
+    def __init__(self, coordinator_url, storage_dir=".", host="127.0.0.1", port=0, worker_id=None, heartbeat_interval=2,
+                 advertise_address=None, proxy_mode="system", proxies=None):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.storage_dir = storage_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.proxy_mode = proxy_mode
+        self.proxies = proxies
+        self.server = ThreadingHTTPServer((host, port), _WorkerHandler)
+        self.server.worker = self
+        self.port = self.server.server_address[1]
+        if advertise_address:
+            self.address = advertise_address.rstrip("/")
+        elif host in ("", "0.0.0.0", "::"):
+            # 由协调节点根据心跳来源 IP 推断地址
+            self.address = None
+        else:
+            self.address = f"http://{host}:{self.port}"
+        self.worker_id = worker_id or f"{socket.gethostname()}:{self.port}"
+        self.lock = threading.Lock()
+        self.shards = {}
+        self.stop_flag = False
+        os.makedirs(storage_dir, exist_ok=True)
+
+    def stop(self, flag):
+        self.stop_flag = flag
+
+    def shard_path(self, key):
+        with self.lock:
+            shard = self.shards.get(key)
+            return shard["path"] if shard and shard["state"] == "done" else None
+
+    def report(self):
+        reports = {}
+        with self.lock:
+            for key, shard in self.shards.items():
+                size = os.path.getsize(shard["path"]) if os.path.exists(shard["path"]) else 0
+                reports[key] = {"state": shard["state"], "attempt": shard["attempt"], "size": size, "sha256": shard["sha256"]}
+        return reports
+
+    def start_shard(self, url, key, start_byte, end_byte, attempt):
+        with self.lock:
+            old = self.shards.get(key)
+            if old and old["attempt"] == attempt:
+                return
+            # 每次分配都从空文件开始，不续写其他任务或旧分片布局留下的数据
+            path = os.path.join(self.storage_dir, f"{key}.{attempt}.shard")
+            open(path, "wb").close()
+            downloader = Downloader(url, download_dir=self.storage_dir, proxy_mode=self.proxy_mode, proxies=self.proxies)
+            shard = {
+                "path": path,
+                "start": start_byte,
+                "end": end_byte,
+                "attempt": attempt,
+                "state": "running",
+                "sha256": None,
+                "downloader": downloader,
+            }
+            self.shards[key] = shard
+        if old:
+            self.discard(old)
+        threading.Thread(target=self.download_shard, args=(shard,), daemon=True).start()
+
+    def download_shard(self, shard):
+        downloader = shard["downloader"]
+        try:
+            downloader.overall_pbar = tqdm(total=shard["end"] - shard["start"] + 1, disable=True)
+            session = requests.Session()
+            transport = downloader.select_transport(session)
+            try:
+                downloader.download_chunk(transport, shard["attempt"], shard["path"], shard["start"], shard["end"])
+            finally:
+                transport.close()
+            if downloader.stop_flag:
+                self.discard(shard)
+                return
+            size = os.path.getsize(shard["path"])
+            sha256 = sha256_file(shard["path"]) if size == shard["end"] - shard["start"] + 1 else None
+        except Exception as e:
+            print(f"Shard {shard['path']} failed: {e}")
+            sha256 = None
+        with self.lock:
+            shard["sha256"] = sha256
+            shard["state"] = "done" if sha256 else "failed"
+
+    def discard(self, shard):
+        shard["downloader"].stop(True)
+        try:
+            os.remove(shard["path"])
+        except OSError:
+            pass
+
+    def release(self, key):
+        with self.lock:
+            shard = self.shards.pop(key, None)
+        if shard is not None:
+            self.discard(shard)
+
+    def heartbeat(self):
+        payload = {"worker_id": self.worker_id, "address": self.address, "port": self.port, "shards": self.report()}
+        response = requests.post(f"{self.coordinator_url}/heartbeat", json=payload, timeout=10)
+        response.raise_for_status()
+        reply = response.json()
+        for key in reply["release"]:
+            self.release(key)
+        for assignment in reply["assign"]:
+            self.start_shard(reply["url"], assignment["key"], assignment["start"], assignment["end"], assignment["attempt"])
+
+    def run(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Worker {self.worker_id} serving shards on {self.address}")
+        try:
+            while not self.stop_flag:
+                try:
+                    self.heartbeat()
+                except requests.RequestException as e:
+                    print(f"Heartbeat to {self.coordinator_url} failed: {e}")
+                time.sleep(self.heartbeat_interval)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shard one download across several nodes")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator")
+    coordinator_parser.add_argument("url")
+    coordinator_parser.add_argument("--download-dir", default=".")
+    coordinator_parser.add_argument("--host", default="127.0.0.1")
+    coordinator_parser.add_argument("--port", type=int, default=9000)
+    coordinator_parser.add_argument("--workers", type=int, default=1)
+    coordinator_parser.add_argument("--chunk-size-mb", type=int, default=20)
+    coordinator_parser.add_argument("--shards-per-worker", type=int, default=2)
+    coordinator_parser.add_argument("--heartbeat-timeout", type=float, default=10)
+    coordinator_parser.add_argument("--stall-heartbeats", type=int, default=15)
+    coordinator_parser.add_argument("--keep-shards", action="store_true")
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("coordinator")
+    worker_parser.add_argument("--storage-dir", default=".")
+    worker_parser.add_argument("--host", default="127.0.0.1")
+    worker_parser.add_argument("--port", type=int, default=0)
+    worker_parser.add_argument("--advertise-address")
+    worker_parser.add_argument("--worker-id")
+    worker_parser.add_argument("--heartbeat-interval", type=float, default=2)
+
+    args = parser.parse_args(argv)
+    if args.role == "coordinator":
+        Coordinator(
+            args.url,
+            download_dir=args.download_dir,
+            host=args.host,
+            port=args.port,
+            num_workers=args.workers,
+            chunk_size_mb=args.chunk_size_mb,
+            shards_per_worker=args.shards_per_worker,
+            heartbeat_timeout=args.heartbeat_timeout,
+            stall_heartbeats=args.stall_heartbeats,
+            assemble=not args.keep_shards,
+        ).run()
+    else:
+        Worker(
+            args.coordinator,
+            storage_dir=args.storage_dir,
+            host=args.host,
+            port=args.port,
+            worker_id=args.worker_id,
+            heartbeat_interval=args.heartbeat_interval,
+            advertise_address=args.advertise_address,
+        ).run()
+
+
+if __name__ == "__main__":
+    main()
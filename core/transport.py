@@ -0,0 +1,382 @@
+import queue
+import select
+import socket
+import ssl
+import threading
+import requests
+from urllib.parse import urlparse
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+
+class TransportError(requests.RequestException):
+    pass
+
+
+class Transport:
+    name = None
+
+    def open_range(self, url, start_byte, end_byte, timeout=60):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    name = "http/1.1"
+
+    def __init__(self, session=None, proxies=None):
+        self.session = session or requests.Session()
+        self.proxies = proxies
+
+    def open_range(self, url, start_byte, end_byte, timeout=60):
+        headers = {"Range": f"bytes={start_byte}-{end_byte}"}
+        response = self.session.get(url, headers=headers, stream=True, proxies=self.proxies, timeout=timeout, verify=False)
+        response.raise_for_status()
+        return response
+
+
+class _H2Stream:
+    def __init__(self, connection, stream_id):
+        self.connection = connection
+        self.stream_id = stream_id
+        self.events = queue.Queue()
+        self.status_code = None
+        self.headers = {}
+        self.ended = False
+
+    def raise_for_status(self):
+        if self.status_code is None or self.status_code >= 300:
+            raise TransportError(f"HTTP/2 stream {self.stream_id} returned status {self.status_code}")
+
+    def wait_for_headers(self, timeout):
+        kind, value = self._next(timeout)
+        if kind != "headers":
+            raise TransportError(f"HTTP/2 stream {self.stream_id} ended before response headers")
+        self.status_code = int(value.pop(":status"))
+        self.headers = value
+
+    def iter_content(self, chunk_size=65536):
+        while not self.ended:
+            kind, value = self._next(self.connection.timeout)
+            if kind == "data":
+                data, flow_controlled_length = value
+                self.connection.acknowledge(self.stream_id, flow_controlled_length)
+                for i in range(0, len(data), chunk_size):
+                    yield data[i:i + chunk_size]
+
+    def _next(self, timeout):
+        try:
+            kind, value = self.events.get(timeout=timeout)
+        except queue.Empty:
+            raise TransportError(f"HTTP/2 stream {self.stream_id} timed out")
+        if kind == "end":
+            self.ended = True
+        elif kind == "error":
+            self.ended = True
+            raise TransportError(value)
+        return kind, value
+
+    def close(self):
+        self.connection.release(self, cancel=not self.ended)
+
+
+class H2Connection:
+    def __init__(self, host, port, timeout=60, stream_window=16 * 1024 * 1024, connection_window=64 * 1024 * 1024, max_frame_size=1024 * 1024):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.settings_received = threading.Event()
+        self.on_capacity = None
+        self.closed = False
+
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.set_alpn_protocols(["h2", "http/1.1"])
+        raw_sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock = context.wrap_socket(raw_sock, server_hostname=host)
+        self.alpn_protocol = self.sock.selected_alpn_protocol()
+        if self.alpn_protocol != "h2":
+            self.sock.close()
+            self.closed = True
+            return
+
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=True, header_encoding="utf-8"))
+        self.conn.local_settings = h2.settings.Settings(client=True, initial_values={
+            h2.settings.SettingCodes.ENABLE_PUSH: 0,
+            h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: stream_window,
+            h2.settings.SettingCodes.MAX_FRAME_SIZE: max_frame_size,
+        })
+        self.conn.max_inbound_frame_size = max_frame_size
+        self.conn.initiate_connection()
+        # 连接级窗口只能通过 WINDOW_UPDATE 扩大，批量下载时放宽到 connection_window
+        self.conn.increment_flow_control_window(connection_window - self.conn.inbound_flow_control_window)
+        self.sock.sendall(self.conn.data_to_send())
+
+        # TLS 套接字只由 I/O 线程读写，其他线程通过 wake 管道通知它发送数据
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.io_thread = threading.Thread(target=self._io_loop, daemon=True)
+        self.io_thread.start()
+
+        # 收到服务器的 SETTINGS 之前不知道 MAX_CONCURRENT_STREAMS，不能开始分配流
+        if not self.settings_received.wait(timeout) or self.closed:
+            self.close()
+            raise TransportError(f"{host}:{port} sent no HTTP/2 SETTINGS")
+
+    def is_usable(self):
+        return not self.closed
+
+    def open_stream(self, authority, path, headers):
+        with self.lock:
+            if self.closed:
+                raise TransportError("HTTP/2 connection is closed")
+            if len(self.streams) >= self.conn.remote_settings.max_concurrent_streams:
+                return None
+            request_headers = [
+                (":method", "GET"),
+                (":authority", authority),
+                (":scheme", "https"),
+                (":path", path),
+            ] + [(k.lower(), v) for k, v in headers.items()]
+            try:
+                stream_id = self.conn.get_next_available_stream_id()
+                self.conn.send_headers(stream_id, request_headers, end_stream=True)
+            except h2.exceptions.ProtocolError as e:
+                raise TransportError(f"HTTP/2 request failed: {e}")
+            stream = _H2Stream(self, stream_id)
+            self.streams[stream_id] = stream
+        self._wake()
+        return stream
+
+    def acknowledge(self, stream_id, flow_controlled_length):
+        with self.lock:
+            if self.closed:
+                return
+            self.conn.acknowledge_received_data(flow_controlled_length, stream_id)
+        self._wake()
+
+    def release(self, stream, cancel=False):
+        with self.lock:
+            if self.streams.pop(stream.stream_id, None) is None:
+                return
+            if not self.closed:
+                # 未读取的数据也占用了连接级窗口，需要归还
+                while not stream.events.empty():
+                    kind, value = stream.events.get_nowait()
+                    if kind == "data":
+                        self.conn.acknowledge_received_data(value[1], stream.stream_id)
+                if cancel:
+                    try:
+                        self.conn.reset_stream(stream.stream_id, error_code=h2.errors.ErrorCodes.CANCEL)
+                    except h2.exceptions.StreamClosedError:
+                        pass
+        self._wake()
+        self._notify_capacity()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.conn.close_connection()
+            self._fail_all("HTTP/2 connection closed")
+        self._wake()
+        self.io_thread.join(timeout=5)
+        self._notify_capacity()
+
+    def _notify_capacity(self):
+        # 必须在释放 self.lock 之后调用，避免与传输层的锁形成环
+        if self.on_capacity:
+            self.on_capacity()
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _fail_all(self, reason):
+        self.closed = True
+        for stream in self.streams.values():
+            stream.events.put(("error", reason))
+        self.settings_received.set()
+
+    def _io_loop(self):
+        try:
+            while not self.closed:
+                if not self.sock.pending():
+                    readable, _, _ = select.select([self.sock, self.wake_r], [], [], 1)
+                else:
+                    readable = [self.sock]
+                try:
+                    while self.wake_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                with self.lock:
+                    outgoing = self.conn.data_to_send()
+                if outgoing:
+                    self.sock.sendall(outgoing)
+                if self.sock not in readable:
+                    continue
+                data = self.sock.recv(1024 * 1024)
+                if not data:
+                    with self.lock:
+                        self._fail_all("HTTP/2 connection closed by server")
+                    break
+                with self.lock:
+                    events = self.conn.receive_data(data)
+                    for event in events:
+                        self._dispatch(event)
+                if any(isinstance(event, h2.events.RemoteSettingsChanged) for event in events):
+                    self._notify_capacity()
+        except (OSError, h2.exceptions.ProtocolError) as e:
+            with self.lock:
+                self._fail_all(f"HTTP/2 connection failed: {e}")
+        finally:
+            try:
+                with self.lock:
+                    outgoing = self.conn.data_to_send()
+                if outgoing:
+                    self.sock.sendall(outgoing)
+            except OSError:
+                pass
+            self.sock.close()
+            self.wake_r.close()
+            self.wake_w.close()
+            self._notify_capacity()
+
+    def _dispatch(self, event):
+        stream = self.streams.get(getattr(event, "stream_id", None))
+        if isinstance(event, h2.events.ResponseReceived) and stream:
+            stream.events.put(("headers", dict(event.headers)))
+        elif isinstance(event, h2.events.DataReceived):
+            if stream:
+                stream.events.put(("data", (event.data, event.flow_controlled_length)))
+            elif event.flow_controlled_length:
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded) and stream:
+            stream.events.put(("end", None))
+        elif isinstance(event, h2.events.StreamReset) and stream:
+            stream.events.put(("error", f"HTTP/2 stream {event.stream_id} reset by server (error {event.error_code})"))
+        elif isinstance(event, h2.events.RemoteSettingsChanged):
+            self.settings_received.set()
+        elif isinstance(event, h2.events.ConnectionTerminated):
+            self._fail_all(f"HTTP/2 connection terminated by server (error {event.error_code})")
+
+
+class HTTP2Transport(Transport):
+    name = "h2"
+
+    def __init__(self, host, port=443, max_connections=2, timeout=60, first_connection=None, **connection_options):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connection_options = connection_options
+        self.connections = []
+        self.connecting = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.capacity = threading.Condition(self.lock)
+        if first_connection:
+            self._adopt(first_connection)
+
+    def _adopt(self, connection):
+        connection.on_capacity = self._notify_capacity
+        self.connections.append(connection)
+
+    def _notify_capacity(self):
+        with self.capacity:
+            self.capacity.notify_all()
+
+    def _open_stream(self, authority, path, headers):
+        # 排队等待空闲流不算请求失败，不设期限，直到传输层被关闭
+        while True:
+            with self.capacity:
+                while True:
+                    if self.closed:
+                        raise TransportError(f"HTTP/2 transport to {self.host}:{self.port} is closed")
+                    self.connections = [c for c in self.connections if c.is_usable()]
+                    for connection in sorted(self.connections, key=lambda c: len(c.streams)):
+                        stream = connection.open_stream(authority, path, headers)
+                        if stream:
+                            return stream
+                    if len(self.connections) + self.connecting < self.max_connections:
+                        self.connecting += 1
+                        break
+                    self.capacity.wait(1)
+            try:
+                connection = H2Connection(self.host, self.port, timeout=self.timeout, **self.connection_options)
+            except OSError as e:
+                raise TransportError(f"HTTP/2 connect to {self.host}:{self.port} failed: {e}")
+            finally:
+                with self.capacity:
+                    self.connecting -= 1
+            if not connection.is_usable():
+                raise TransportError(f"{self.host}:{self.port} did not negotiate h2")
+            with self.capacity:
+                if not self.closed:
+                    self._adopt(connection)
+                    continue
+            connection.close()
+            raise TransportError(f"HTTP/2 transport to {self.host}:{self.port} is closed")
+
+    def open_range(self, url, start_byte, end_byte, timeout=60):
+        parsed_url = urlparse(url)
+        path = parsed_url.path or "/"
+        if parsed_url.query:
+            path += "?" + parsed_url.query
+        stream = self._open_stream(parsed_url.netloc, path, {"Range": f"bytes={start_byte}-{end_byte}"})
+        try:
+            stream.wait_for_headers(timeout)
+            stream.raise_for_status()
+        except TransportError:
+            stream.close()
+            raise
+        return stream
+
+    def close(self):
+        with self.capacity:
+            self.closed = True
+            connections, self.connections = self.connections, []
+            self.capacity.notify_all()
+        for connection in connections:
+            connection.close()
+
+
+def select_transport(url, session=None, proxies=None, prefer="auto", **h2_options):
+    if prefer == "http1":
+        return RequestsTransport(session, proxies)
+    parsed_url = urlparse(url)
+    # HTTP/2 只在直连 https 时通过 ALPN 协商；走代理或未安装 h2 时退回 requests
+    if not HAS_H2 or parsed_url.scheme != "https" or proxies:
+        if prefer == "http2":
+            raise TransportError("HTTP/2 requires the h2 package, an https URL and no proxy")
+        return RequestsTransport(session, proxies)
+    host, port = parsed_url.hostname, parsed_url.port or 443
+    try:
+        connection_options = {k: v for k, v in h2_options.items() if k != "max_connections"}
+        connection = H2Connection(host, port, **connection_options)
+    except (OSError, TransportError) as e:
+        if prefer == "http2":
+            raise TransportError(f"HTTP/2 connect to {host}:{port} failed: {e}")
+        return RequestsTransport(session, proxies)
+    if not connection.is_usable():
+        if prefer == "http2":
+            raise TransportError(f"{host}:{port} did not negotiate h2")
+        return RequestsTransport(session, proxies)
+    return HTTP2Transport(host, port, first_connection=connection, **h2_options)
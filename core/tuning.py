@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+MIN_CHUNK_SIZE_MB = 1
+MAX_CHUNK_SIZE_MB = 64
+MIN_PROBE_FILE_SIZE = 64 * 1024 * 1024
+MIN_PROBE_BYTES = 1024 * 1024
+PROFILE_TTL = 7 * 24 * 3600
+
+# 所有 HostProfileStore 实例共用一把锁，避免多个下载任务同时读写同一个文件
+_STORE_LOCK = threading.Lock()
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class HostProfileStore:
+    def __init__(self, path="host_profiles.json", ttl=PROFILE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def load_all(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_all(self, profiles):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(profiles, f, indent=4)
+        os.replace(temp_path, self.path)
+
+    def get(self, host):
+        with _STORE_LOCK:
+            profile = self.load_all().get(host)
+        if profile and self.ttl is not None and time.time() - profile.get("updated", 0) > self.ttl:
+            return None
+        return profile
+
+    def put(self, host, profile):
+        with _STORE_LOCK:
+            profiles = self.load_all()
+            profiles[host] = profile
+            self.save_all(profiles)
+
+    def remove(self, host):
+        with _STORE_LOCK:
+            profiles = self.load_all()
+            if profiles.pop(host, None) is not None:
+                self.save_all(profiles)
+
+
+class Prober:
+    def __init__(self, url, file_size, proxies=None, max_connections=32, probe_seconds=2.0, chunk_seconds=8.0, budget=None):
+        self.url = url
+        self.file_size = file_size
+        self.proxies = proxies
+        self.max_connections = max_connections
+        self.probe_seconds = probe_seconds
+        self.chunk_seconds = chunk_seconds
+        # 所有探测请求合计最多向源站请求 budget 字节，默认是文件大小的四分之一
+        self.budget = file_size // 4 if budget is None else budget
+        self.remaining = self.budget
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            size = max(0, min(size, self.remaining))
+            self.remaining -= size
+            return size
+
+    def measure_rtt(self, session, samples=3):
+        timings = []
+        for _ in range(samples):
+            start = time.monotonic()
+            response = session.head(self.url, allow_redirects=True, proxies=self.proxies, timeout=10, verify=False)
+            response.raise_for_status()
+            timings.append(time.monotonic() - start)
+        return min(timings)
+
+    def warm_up(self, session):
+        response = session.head(self.url, allow_redirects=True, proxies=self.proxies, timeout=10, verify=False)
+        response.raise_for_status()
+
+    def measure_throughput(self, session, start_byte=0, size=None):
+        # 从首字节开始计时并持续 probe_seconds 秒，排除握手和 TCP 慢启动初期的影响
+        # 请求的范围是有界的，提前停止读取时源站最多也只发送 size 字节
+        size = self.reserve(min(self.file_size - start_byte, self.remaining if size is None else size))
+        if size <= 0:
+            return 0
+        headers = {"Range": f"bytes={start_byte}-{start_byte + size - 1}"}
+        response = session.get(self.url, headers=headers, stream=True, proxies=self.proxies, timeout=10, verify=False)
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            raise requests.RequestException("server ignored Range header")
+        start = None
+        received = 0
+        try:
+            for chunk in response.iter_content(chunk_size=65536):
+                if start is None:
+                    start = time.monotonic()
+                    continue
+                received += len(chunk)
+                if time.monotonic() - start >= self.probe_seconds:
+                    break
+        finally:
+            response.close()
+        if start is None:
+            return 0
+        elapsed = max(time.monotonic() - start, 1e-6)
+        return received / elapsed
+
+    def measure_concurrency(self, per_connection):
+        best_level, best_rate = 1, per_connection
+        level = 2
+        while level <= self.max_connections:
+            # 每一级最多用掉剩余预算的一半，单个连接分到的字节太少时测不准，停止加压
+            size = self.remaining // 2 // level
+            if size < MIN_PROBE_BYTES:
+                break
+            sessions = [requests.Session() for _ in range(level)]
+            try:
+                with ThreadPoolExecutor(max_workers=level) as executor:
+                    list(executor.map(self.warm_up, sessions))
+                    rates = list(executor.map(
+                        lambda args: self.measure_throughput(*args),
+                        [(s, i * self.file_size // level, size) for i, s in enumerate(sessions)]
+                    ))
+            except requests.RequestException:
+                # 服务器拒绝更多连接（429/503 或连接重置），视为已达到连接上限
+                break
+            finally:
+                for s in sessions:
+                    s.close()
+            rate = sum(rates)
+            if rate < best_rate * 1.1:
+                break
+            best_level, best_rate = level, rate
+            level *= 2
+        return best_level, best_rate
+
+    def choose_chunk_size_mb(self, rtt, per_connection):
+        # 每个分块至少传输 chunk_seconds 秒，并远大于一次往返的开销
+        target = max(per_connection * self.chunk_seconds, per_connection * rtt * 50)
+        chunk_size_mb = int(target // (1024 * 1024))
+        return max(MIN_CHUNK_SIZE_MB, min(MAX_CHUNK_SIZE_MB, chunk_size_mb))
+
+    def run(self, session):
+        rtt = self.measure_rtt(session)
+        per_connection = self.measure_throughput(session, size=self.budget // 4)
+        max_connections, aggregate = self.measure_concurrency(per_connection)
+        return {
+            "rtt": rtt,
+            "throughput": per_connection,
+            "aggregate_throughput": aggregate,
+            "max_connections": max_connections,
+            "chunk_size_mb": self.choose_chunk_size_mb(rtt, per_connection),
+            "max_workers": max_connections,
+            "updated": time.time(),
+        }
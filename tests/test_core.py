@@ -0,0 +1,88 @@
+import os
+import re
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import Downloader
+
+
+DATA = os.urandom(1024 * 1024)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ignore_range = False
+    fail_from = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(DATA)))
+        self.end_headers()
+
+    def do_GET(self):
+        match = None if self.ignore_range else re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        start = int(match.group(1)) if match else 0
+        end = int(match.group(2)) if match and match.group(2) else len(DATA) - 1
+        if self.fail_from is not None and start >= self.fail_from:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Length", str(end - start + 1))
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        self.end_headers()
+        try:
+            self.wfile.write(DATA[start:end + 1])
+        except OSError:
+            pass
+
+
+def serve(**attrs):
+    handler = type("Handler", (_Handler,), attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_downloader(server, tmp_path, max_workers):
+    url = f"http://127.0.0.1:{server.server_address[1]}/data.bin"
+    return Downloader(url, download_dir=str(tmp_path), chunk_size_mb=1, max_workers=max_workers, proxy_mode="manual")
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_server_ignoring_range(tmp_path, max_workers):
+    server = serve(ignore_range=True)
+    try:
+        downloader = make_downloader(server, tmp_path, max_workers)
+        downloader.download()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert downloader.is_completed()
+    assert downloader.range_supported is False
+    with open(tmp_path / "data.bin", "rb") as f:
+        assert f.read() == DATA
+
+
+def test_failed_chunk_raises(tmp_path):
+    server = serve(fail_from=len(DATA) // 2)
+    try:
+        downloader = make_downloader(server, tmp_path, 4)
+        with pytest.raises(requests.RequestException):
+            downloader.download()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not downloader.is_completed()
+    assert not os.path.exists(tmp_path / "data.bin")
@@ -0,0 +1,198 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import hashlib
+import threading
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.distributed import Coordinator, main
+
+
+DATA = os.urandom(3 * 1024 * 1024)
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(DATA)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        start = int(match.group(1)) if match else 0
+        end = min(int(match.group(2)), len(DATA) - 1) if match and match.group(2) else len(DATA) - 1
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Length", str(end - start + 1))
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        self.end_headers()
+        # 限速，保证杀掉工作节点时它的分片还没下完
+        for offset in range(start, end + 1, 32 * 1024):
+            try:
+                self.wfile.write(DATA[offset:min(offset + 32 * 1024, end + 1)])
+            except OSError:
+                return
+            time.sleep(0.05)
+
+
+class _ShardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        for offset in range(0, len(self.server.body), 64 * 1024):
+            self.wfile.write(self.server.body[offset:offset + 64 * 1024])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_job(tmp_path, assemble):
+    origin = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    port = free_port()
+    coordinator = Coordinator(
+        f"http://127.0.0.1:{origin.server_address[1]}/data.bin",
+        download_dir=str(tmp_path / "download"),
+        port=port,
+        num_workers=3,
+        chunk_size_mb=1,
+        shards_per_worker=2,
+        heartbeat_timeout=1,
+        assemble=assemble,
+    )
+    errors = []
+
+    def run_coordinator():
+        try:
+            coordinator.run()
+        except Exception as e:
+            errors.append(e)
+
+    coordinator_thread = threading.Thread(target=run_coordinator, daemon=True)
+    coordinator_thread.start()
+
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    for i in range(1, 4):
+        worker_id = f"w{i}"
+        argv = ["worker", f"http://127.0.0.1:{port}", "--storage-dir", str(tmp_path / worker_id),
+                "--worker-id", worker_id, "--heartbeat-interval", "0.2"]
+        workers[worker_id] = context.Process(target=main, args=(argv,), daemon=True)
+        workers[worker_id].start()
+
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            with coordinator.lock:
+                killed_shards = [s["key"] for s in coordinator.shards.values() if s["worker"] == "w2" and s["state"] == "assigned"]
+            if killed_shards:
+                break
+            time.sleep(0.05)
+        assert killed_shards, "w2 never received a shard"
+        workers["w2"].kill()
+
+        coordinator_thread.join(timeout=60)
+        assert not coordinator_thread.is_alive()
+        assert not errors
+    finally:
+        for process in workers.values():
+            process.kill()
+        origin.shutdown()
+        origin.server_close()
+    return coordinator, killed_shards
+
+
+def test_assemble_after_worker_failure(tmp_path):
+    coordinator, killed_shards = run_job(tmp_path, assemble=True)
+
+    assert coordinator.is_completed()
+    with open(tmp_path / "download" / "data.bin", "rb") as f:
+        assert f.read() == DATA
+    assert coordinator.workers["w2"]["alive"] is False
+    for key in killed_shards:
+        shard = coordinator.shards[key]
+        assert shard["worker"] != "w2"
+        assert shard["attempts"] >= 2
+
+
+def test_keep_shards_manifest(tmp_path):
+    coordinator, killed_shards = run_job(tmp_path, assemble=False)
+
+    assert coordinator.is_completed()
+    assert not os.path.exists(tmp_path / "download" / "data.bin")
+    with open(tmp_path / "download" / "data.bin.manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["file_name"] == "data.bin"
+    assert manifest["file_size"] == len(DATA)
+
+    next_start = 0
+    for shard in sorted(manifest["shards"], key=lambda s: s["start"]):
+        assert shard["start"] == next_start
+        next_start = shard["end"] + 1
+        assert shard["worker"] != "w2"
+        assert shard["address"] == coordinator.workers[shard["worker"]]["address"]
+        expected = DATA[shard["start"]:shard["end"] + 1]
+        assert shard["sha256"] == hashlib.sha256(expected).hexdigest()
+        with open(tmp_path / shard["worker"] / f"{shard['key']}.{shard['attempt']}.shard", "rb") as f:
+            assert f.read() == expected
+    assert next_start == len(DATA)
+    assert set(killed_shards) <= {s["key"] for s in manifest["shards"]}
+
+
+def test_fetch_shard_failures_requeue(tmp_path):
+    origin = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    worker = ThreadingHTTPServer(("127.0.0.1", 0), _ShardHandler)
+    threading.Thread(target=worker.serve_forever, daemon=True).start()
+    address = f"http://127.0.0.1:{worker.server_address[1]}"
+    try:
+        coordinator = Coordinator(f"http://127.0.0.1:{origin.server_address[1]}/data.bin",
+                                  download_dir=str(tmp_path), chunk_size_mb=1, num_workers=1, shards_per_worker=4)
+        coordinator.plan()
+    finally:
+        origin.shutdown()
+        origin.server_close()
+    first, second = sorted(coordinator.shards.values(), key=lambda s: s["start"])[:2]
+
+    def fetch(body):
+        worker.body = body
+        first.update(state="done", worker="w1", attempts=1, sha256=hashlib.sha256(body).hexdigest())
+        coordinator.fetching.add(first["key"])
+        coordinator.fetch_shard(first["key"], "w1", address, first["sha256"])
+        assert first["key"] not in coordinator.fetching
+        assert first["state"] == "pending"
+
+    try:
+        # 工作节点返回的数据比分片长时，不能写进相邻分片
+        fetch(DATA[:first["end"] + 1] + b"x" * (2 * 1024 * 1024))
+        with open(tmp_path / "data.bin", "rb") as f:
+            f.seek(second["start"])
+            assert f.read(second["end"] - second["start"] + 1) == bytes(second["end"] - second["start"] + 1)
+
+        # 非网络异常也要清理 fetching 并重新排队
+        coordinator.final_file_path = str(tmp_path / "missing" / "data.bin")
+        fetch(DATA[:first["end"] + 1])
+    finally:
+        worker.shutdown()
+        worker.server_close()
@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import ssl
+import time
+import shutil
+import select
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+h2 = pytest.importorskip("h2")
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import h2.settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.transport import HTTP2Transport, RequestsTransport, TransportError, select_transport
+
+
+DATA = os.urandom(2 * 1024 * 1024)
+
+
+class _H2Server:
+    def __init__(self, certfile, keyfile, max_streams=100, alpn=("h2", "http/1.1"), drop_after=None, delay=0.005):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.context.set_alpn_protocols(list(alpn))
+        self.max_streams = max_streams
+        self.drop_after = drop_after
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.max_active = 0
+        self.resets = 0
+        self.stopped = False
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.listener.settimeout(0.1)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def url(self, path="/data.bin"):
+        return f"https://127.0.0.1:{self.port}{path}"
+
+    def close(self):
+        self.stopped = True
+        self.listener.close()
+
+    def _accept_loop(self):
+        while not self.stopped:
+            try:
+                raw, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(raw,), daemon=True).start()
+
+    def _serve(self, raw):
+        try:
+            sock = self.context.wrap_socket(raw, server_side=True)
+        except OSError:
+            raw.close()
+            return
+        with self.lock:
+            self.connections += 1
+            index = self.connections
+        if sock.selected_alpn_protocol() != "h2":
+            sock.close()
+            return
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.local_settings = h2.settings.Settings(client=False, initial_values={
+            h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: self.max_streams,
+        })
+        conn.initiate_connection()
+        pending = {}
+        sent = 0
+        try:
+            sock.sendall(conn.data_to_send())
+            while not self.stopped:
+                readable, _, _ = select.select([sock], [], [], 0 if pending or sock.pending() else 0.05)
+                if readable or sock.pending():
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    for event in conn.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            match = re.match(r"bytes=(\d+)-(\d+)", dict(event.headers).get("range", ""))
+                            start, end = int(match.group(1)), min(int(match.group(2)), len(DATA) - 1)
+                            conn.send_headers(event.stream_id, [
+                                (":status", "206"),
+                                ("content-length", str(end - start + 1)),
+                                ("content-range", f"bytes {start}-{end}/{len(DATA)}"),
+                            ])
+                            pending[event.stream_id] = DATA[start:end + 1]
+                            with self.lock:
+                                self.max_active = max(self.max_active, len(pending))
+                        elif isinstance(event, h2.events.StreamReset):
+                            if pending.pop(event.stream_id, None) is not None:
+                                with self.lock:
+                                    self.resets += 1
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                for stream_id in list(pending):
+                    body = pending[stream_id]
+                    size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, 16384, len(body))
+                    if size <= 0 and body:
+                        continue
+                    conn.send_data(stream_id, body[:size], end_stream=size == len(body))
+                    sent += size
+                    if size == len(body):
+                        del pending[stream_id]
+                    else:
+                        pending[stream_id] = body[size:]
+                sock.sendall(conn.data_to_send())
+                if self.drop_after is not None and index == 1 and sent >= self.drop_after:
+                    # 直接断开第一条连接，不发送 GOAWAY
+                    break
+                if pending:
+                    time.sleep(self.delay)
+        except (OSError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            sock.close()
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    if not shutil.which("openssl"):
+        pytest.skip("openssl is required to create a test certificate")
+    directory = tmp_path_factory.mktemp("cert")
+    certfile, keyfile = str(directory / "cert.pem"), str(directory / "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
+
+
+@pytest.fixture
+def serve(certificate):
+    servers = []
+
+    def start(**options):
+        servers.append(_H2Server(*certificate, **options))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def fetch(transport, url, start, end, timeout=10):
+    response = transport.open_range(url, start, end, timeout=timeout)
+    try:
+        assert response.status_code == 206
+        return b"".join(response.iter_content())
+    finally:
+        response.close()
+
+
+def test_alpn_fallback(serve):
+    server = serve(alpn=("http/1.1",))
+    assert isinstance(select_transport(server.url()), RequestsTransport)
+    assert isinstance(select_transport(server.url().replace("https://", "http://")), RequestsTransport)
+    with pytest.raises(TransportError):
+        select_transport(server.url(), prefer="http2")
+
+
+@pytest.mark.parametrize("max_streams", [1, 2, 100])
+def test_stream_limit(serve, max_streams):
+    server = serve(max_streams=max_streams, delay=0.02)
+    transport = select_transport(server.url(), max_connections=2)
+    assert isinstance(transport, HTTP2Transport)
+    size = 256 * 1024
+    ranges = [(i * size, (i + 1) * size - 1) for i in range(8)]
+    try:
+        # 排队等待空闲流的时间远超单个请求的超时，也不能算作失败
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            bodies = list(executor.map(lambda r: fetch(transport, server.url(), *r, timeout=0.5), ranges))
+    finally:
+        transport.close()
+    assert b"".join(bodies) == DATA
+    assert server.connections <= 2
+    assert server.max_active <= max_streams
+    if max_streams == 1:
+        assert server.connections == 2
+
+
+def test_cancel_returns_window(serve):
+    server = serve()
+    window = 128 * 1024
+    transport = select_transport(server.url(), max_connections=1, timeout=5,
+                                 stream_window=window, connection_window=window)
+    try:
+        for _ in range(5):
+            response = transport.open_range(server.url(), 0, len(DATA) - 1)
+            next(response.iter_content())
+            response.close()
+        assert fetch(transport, server.url(), 0, len(DATA) - 1) == DATA
+    finally:
+        transport.close()
+    assert server.resets >= 1
+    assert server.connections == 1
+
+
+def test_connection_lost_mid_stream(serve):
+    server = serve(drop_after=256 * 1024)
+    transport = select_transport(server.url(), max_connections=1)
+    try:
+        with pytest.raises(TransportError):
+            fetch(transport, server.url(), 0, len(DATA) - 1)
+        assert fetch(transport, server.url(), 0, len(DATA) - 1) == DATA
+    finally:
+        transport.close()
+    assert server.connections == 2
+
+
+def test_close_wakes_waiters(serve):
+    server = serve(max_streams=1, delay=0.05)
+    transport = select_transport(server.url(), max_connections=1)
+    response = transport.open_range(server.url(), 0, len(DATA) - 1)
+    errors = []
+
+    def wait_for_stream():
+        try:
+            transport.open_range(server.url(), 0, 0)
+        except TransportError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait_for_stream)
+    waiter.start()
+    time.sleep(0.3)
+    transport.close()
+    waiter.join(timeout=5)
+    response.close()
+    assert not waiter.is_alive()
+    assert len(errors) == 1
@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.core
+from core import Downloader, HostProfileStore
+from core import tuning
+from core.tuning import MAX_CHUNK_SIZE_MB, MIN_CHUNK_SIZE_MB, Prober, host_of
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    data = b""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.data)))
+        self.end_headers()
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        start = int(match.group(1)) if match else 0
+        end = min(int(match.group(2)), len(self.data) - 1) if match and match.group(2) else len(self.data) - 1
+        self.server.ranges.append(self.headers.get("Range"))
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Length", str(end - start + 1))
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.data)}")
+        self.end_headers()
+        for offset in range(start, end + 1, 65536):
+            block = self.data[offset:min(offset + 65536, end + 1)]
+            try:
+                self.wfile.write(block)
+            except OSError:
+                return
+            with self.server.lock:
+                self.server.sent += len(block)
+
+
+@pytest.fixture
+def origin():
+    servers = []
+
+    def start(data):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), type("Handler", (_CountingHandler,), {"data": data}))
+        server.ranges, server.sent, server.lock = [], 0, threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/data.bin"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_profile(**values):
+    profile = {"chunk_size_mb": 8, "max_workers": 16, "updated": time.time()}
+    profile.update(values)
+    return profile
+
+
+def test_profile_ttl(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    store = HostProfileStore(path, ttl=60)
+    store.put("fresh", make_profile())
+    store.put("stale", make_profile(updated=time.time() - 120))
+    assert store.get("fresh")["max_workers"] == 16
+    assert store.get("stale") is None
+    assert store.get("missing") is None
+    assert HostProfileStore(path, ttl=None).get("stale") is not None
+
+
+def test_save_keeps_old_file_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / "profiles.json"
+    store = HostProfileStore(str(path))
+    store.put("a", make_profile())
+    before = path.read_text()
+
+    def broken_dump(obj, f, **kwargs):
+        f.write("{")
+        raise ValueError("disk full")
+
+    monkeypatch.setattr(tuning.json, "dump", broken_dump)
+    with pytest.raises(ValueError):
+        store.put("b", make_profile())
+    assert path.read_text() == before
+    monkeypatch.undo()
+    assert set(json.loads(path.read_text())) == {"a"}
+    assert store.get("b") is None
+
+
+def test_choose_chunk_size_clamps():
+    prober = Prober("http://example.com/f", 0, chunk_seconds=8.0)
+    mb = 1024 * 1024
+    assert prober.choose_chunk_size_mb(0.01, 1024) == MIN_CHUNK_SIZE_MB
+    assert prober.choose_chunk_size_mb(0.01, 1024 * mb) == MAX_CHUNK_SIZE_MB
+    assert prober.choose_chunk_size_mb(0.01, mb) == 8
+    # 高延迟链路按往返时间放大分块
+    assert prober.choose_chunk_size_mb(0.5, mb) == 25
+
+
+def test_small_file_skips_probe(tmp_path, origin, monkeypatch):
+    data = os.urandom(1024 * 1024)
+    _, url = origin(data)
+
+    def fail_run(self, session):
+        raise AssertionError("probe should be skipped for small files")
+
+    monkeypatch.setattr(Prober, "run", fail_run)
+    store = HostProfileStore(str(tmp_path / "profiles.json"))
+    downloader = Downloader(url, download_dir=str(tmp_path), chunk_size_mb=1, max_workers=4,
+                            proxy_mode="manual", auto_tune=True, profile_store=store)
+    downloader.download()
+    assert downloader.is_completed()
+    assert (downloader.chunk_size_mb, downloader.max_workers) == (1, 4)
+    assert store.load_all() == {}
+    with open(tmp_path / "data.bin", "rb") as f:
+        assert f.read() == data
+
+
+def test_resumed_state_wins_over_profile(tmp_path, origin, monkeypatch):
+    data = os.urandom(1024 * 1024)
+    _, url = origin(data)
+    monkeypatch.setattr(Prober, "run", lambda self, session: pytest.fail("resumed download must not probe"))
+    store = HostProfileStore(str(tmp_path / "profiles.json"))
+    store.put(host_of(url), make_profile())
+    os.makedirs(tmp_path / "data")
+    with open(tmp_path / "data" / "data.bin.state", "w") as f:
+        json.dump({"url": url, "chunk_size_bytes": 1024 * 1024, "max_workers": 2}, f)
+    with open(tmp_path / "data" / "data.bin.part0", "wb") as f:
+        f.write(data[:1000])
+
+    downloader = Downloader(url, download_dir=str(tmp_path), proxy_mode="manual", auto_tune=True, profile_store=store)
+    downloader.download()
+    assert downloader.is_completed()
+    assert (downloader.chunk_size_mb, downloader.max_workers) == (1, 2)
+    with open(tmp_path / "data.bin", "rb") as f:
+        assert f.read() == data
+
+
+def test_probe_stays_within_budget(tmp_path, origin, monkeypatch):
+    data = os.urandom(32 * 1024 * 1024)
+    server, url = origin(data)
+    monkeypatch.setattr(core.core, "MIN_PROBE_FILE_SIZE", 0)
+    store = HostProfileStore(str(tmp_path / "profiles.json"))
+    downloader = Downloader(url, download_dir=str(tmp_path), max_workers=8,
+                            proxy_mode="manual", auto_tune=True, profile_store=store)
+    downloader.download()
+    assert downloader.is_completed()
+    assert store.get(host_of(url)) is not None
+    # 整个文件 + 探测预算（文件的四分之一）+ Range 探测的 1 字节
+    assert server.sent <= len(data) + len(data) // 4 + 1
+    assert all(re.fullmatch(r"bytes=\d+-\d+", r) for r in server.ranges)
+    with open(tmp_path / "data.bin", "rb") as f:
+        assert f.read() == data